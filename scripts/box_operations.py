@@ -1,11 +1,32 @@
-import io
+import asyncio
+import errno
+import functools
+import hashlib
+import json
+import logging
+import mmap
 import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+import aiofiles
+import httpx
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from boxsdk import OAuth2, Client
-from boxsdk.exception import BoxAPIException
+from boxsdk.exception import BoxAPIException, BoxOAuthException
+from boxsdk.network.default_network import DefaultNetwork
+from boxsdk.session.session import Session, AuthorizedSession
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 BOX_CLIENT_ID = os.getenv('BOX_CLIENT_ID')
 BOX_CLIENT_SECRET = os.getenv('BOX_CLIENT_SECRET')
 BOX_REFRESH_TOKEN = os.getenv('BOX_REFRESH_TOKEN')
@@ -15,108 +36,620 @@ BOX_UPLOAD_FOLDER_ID = os.getenv('BOX_UPLOAD_FOLDER_ID')
 
 SOURCE_DATA_DIR = os.getenv('SOURCE_DATA_DIR')
 
+_DEFAULT_WORKERS = str(min(32, (os.cpu_count() or 4) * 4))
+BOX_DOWNLOAD_WORKERS = int(os.getenv('BOX_DOWNLOAD_WORKERS', _DEFAULT_WORKERS))
+BOX_UPLOAD_WORKERS = int(os.getenv('BOX_UPLOAD_WORKERS', _DEFAULT_WORKERS))
+BOX_CHUNK_SIZE = int(os.getenv('BOX_CHUNK_SIZE', str(1 << 20)))
+BOX_RETRY_MAX = int(os.getenv('BOX_RETRY_MAX', '3'))
+if BOX_RETRY_MAX < 1:
+    raise ValueError(f"BOX_RETRY_MAX counts attempts and must be at least 1 (1 disables retries), got {BOX_RETRY_MAX}.")
+BOX_DIRECT_IO = os.getenv('BOX_DIRECT_IO') == '1'
+
+BOX_TOKENS_FILE = os.path.expanduser('~/.box_tokens.json')
+# Box access tokens live for 60 minutes; treat them as expired a little early.
+ACCESS_TOKEN_LIFETIME = 60 * 60 - 5 * 60
+
+# Authenticated clients are cached per process, keyed by the token they were built from,
+# so the underlying requests.Session (and its pooled keep-alive connections) is reused.
+_CLIENT_CACHE = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+_RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+_RETRYABLE_EXCEPTIONS = (
+    BoxAPIException,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.ReadTimeoutError,
+)
+
+BOX_API_URL = 'https://api.box.com/2.0'
+ASYNC_MAX_CONNECTIONS = 32
+
+CHUNKED_UPLOAD_THRESHOLD = 50 * 1024 * 1024
+
+_CONFIGURED = False
+
+def configure():
+    """Validate the Box OAuth2 settings loaded from .env; raises RuntimeError if any are missing."""
+    global _CONFIGURED
+    missing = [name for name, value in (
+        ('BOX_CLIENT_ID', BOX_CLIENT_ID),
+        ('BOX_CLIENT_SECRET', BOX_CLIENT_SECRET),
+        ('BOX_REFRESH_TOKEN', BOX_REFRESH_TOKEN),
+    ) if not value]
+    if missing:
+        raise RuntimeError(
+            f"Required Box OAuth2 environment variables are missing from .env: {', '.join(missing)}. "
+            "Ensure BOX_CLIENT_ID, BOX_CLIENT_SECRET are set from your Box App config, and BOX_REFRESH_TOKEN is obtained via get_box_tokens.py."
+        )
+    _CONFIGURED = True
+
 def store_tokens(access_token, refresh_token):
-    pass 
+    tokens = {
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'expires_at': time.time() + ACCESS_TOKEN_LIFETIME,
+        # Lets a refresh token newly pasted into .env take precedence over this file.
+        'seed_refresh_token': BOX_REFRESH_TOKEN,
+    }
+    token_dir = os.path.dirname(BOX_TOKENS_FILE)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=token_dir, prefix='.box_tokens.')
+        try:
+            os.chmod(tmp_path, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(tokens, f)
+            os.replace(tmp_path, BOX_TOKENS_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        log.warning(f"Could not persist Box tokens to {BOX_TOKENS_FILE}: {e}")
 
-def get_box_client():
-    if not all([BOX_CLIENT_ID, BOX_CLIENT_SECRET, BOX_REFRESH_TOKEN]):
-        print("ERROR: One or more required Box OAuth2 environment variables (CLIENT_ID, CLIENT_SECRET, REFRESH_TOKEN) are missing from .env.")
-        print("Ensure BOX_CLIENT_ID, BOX_CLIENT_SECRET are set from your Box App config, and BOX_REFRESH_TOKEN is obtained via get_box_tokens.py.")
-        return None
+def load_stored_tokens():
+    try:
+        with open(BOX_TOKENS_FILE) as f:
+            tokens = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    if tokens.get('seed_refresh_token') != BOX_REFRESH_TOKEN:
+        return None, None
+    access_token = tokens.get('access_token')
+    if tokens.get('expires_at', 0) <= time.time():
+        access_token = None
+    return access_token, tokens.get('refresh_token')
+
+class _PooledNetwork(DefaultNetwork):
+    """boxsdk 3.x network layer whose requests.Session pool is sized for the worker threads.
+
+    requests keeps at most 10 connections per host; with more worker threads the extras open
+    short-lived connections (a TLS handshake each) that are discarded instead of reused.
+    Retries stay with boxsdk and the retry decorator.
+    """
+
+    def __init__(self, pool_size):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount('https://', adapter)
+
+def get_box_client(access_token=None):
+    """Return the cached Box client; pass a developer access_token to bypass the refresh-token flow."""
+    cache_key = access_token or BOX_REFRESH_TOKEN
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(cache_key)
+        if client is None:
+            client = _build_box_client(access_token)
+            if client is not None:
+                _CLIENT_CACHE[cache_key] = client
+    return client
+
+def _build_box_client(developer_token=None):
+    if developer_token is None and not _CONFIGURED:
+        configure()
 
     try:
+        # Token refreshes and API calls share one network layer, and therefore one requests.Session.
+        session = Session(network_layer=_PooledNetwork(max(BOX_DOWNLOAD_WORKERS, BOX_UPLOAD_WORKERS)))
+        if developer_token:
+            access_token, refresh_token = developer_token, None
+        else:
+            access_token, refresh_token = load_stored_tokens()
+            refresh_token = refresh_token or BOX_REFRESH_TOKEN
         oauth = OAuth2(
             client_id=BOX_CLIENT_ID,
             client_secret=BOX_CLIENT_SECRET,
-            access_token=None,  
-            refresh_token=BOX_REFRESH_TOKEN,
-            store_tokens=store_tokens,
+            access_token=access_token,
+            refresh_token=refresh_token,
+            store_tokens=None if developer_token else store_tokens,
+            session=session,
         )
-        
-        return Client(oauth)
+
+        return Client(oauth, session=AuthorizedSession(oauth, **session.get_constructor_kwargs()))
     except Exception as e:
-        print(f"Error authenticating with Box using OAuth2 Refresh Token: {e}")
-        print("Possible causes: Invalid BOX_CLIENT_ID, BOX_CLIENT_SECRET, or expired/invalid BOX_REFRESH_TOKEN.")
-        print("If BOX_REFRESH_TOKEN is invalid, re-run get_box_tokens.py to get a new one.")
+        log.error(f"Error authenticating with Box using OAuth2 Refresh Token: {e}")
+        log.error("Possible causes: Invalid BOX_CLIENT_ID, BOX_CLIENT_SECRET, or expired/invalid BOX_REFRESH_TOKEN.")
+        log.error("If BOX_REFRESH_TOKEN is invalid, re-run get_box_tokens.py to get a new one.")
         return None
 
-def download_box_files(folder_id, target_dir, file_prefix_filter=None):
+def retry(max_attempts=BOX_RETRY_MAX, base=0.25, cap=30.0):
+    """Retry transient Box failures (429/5xx, connection errors) with jittered exponential backoff.
+
+    boxsdk's Session already retries 429/5xx responses up to API.MAX_RETRY_ATTEMPTS (5) times per
+    request, so a retryable status here costs up to max_attempts * 5 requests. The main job of this
+    decorator is the connection drops and read timeouts that surface while download_to is consuming
+    the raw urllib3 stream, which boxsdk does not retry.
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except _RETRYABLE_EXCEPTIONS as e:
+                    status = getattr(e, 'status', None)
+                    if status is not None and status not in _RETRYABLE_STATUSES:
+                        raise
+                    if attempt == max_attempts - 1:
+                        raise
+
+                    delay = min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    if status == 429:
+                        retry_after = (e.headers or {}).get('Retry-After')
+                        try:
+                            delay = float(retry_after)
+                        except (TypeError, ValueError):
+                            pass
+                    log.warning(f"{func.__name__} failed ({e.__class__.__name__}, status {status}); retrying in {delay:.2f}s (attempt {attempt + 1}/{max_attempts})")
+                    time.sleep(delay)
+                    attempt += 1
+        return wrapper
+    return decorator
+
+def _sha1_file(file_path):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(BOX_CHUNK_SIZE), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def _is_up_to_date(file_path, size, sha1):
+    """True if file_path already holds the remote content, judged by size and then SHA1.
+
+    Any local I/O error (unreadable file, a directory in the way) means "download it", so the
+    failure is reported per file by the download itself rather than aborting the batch.
+    """
+    if size is None or sha1 is None:
+        return False
+    try:
+        return os.path.getsize(file_path) == size and _sha1_file(file_path) == sha1
+    except OSError:
+        return False
+
+class _DirectWriter:
+    """Write-only file object that writes page-aligned BOX_CHUNK_SIZE blocks to an O_DIRECT fd.
+
+    O_DIRECT is dropped (fcntl) for the final partial block, and for the rest of the file if
+    the filesystem rejects a direct write with EINVAL.
+    """
+
+    def __init__(self, fd, chunk_size):
+        self._fd = fd
+        self._size = max(mmap.PAGESIZE, chunk_size // mmap.PAGESIZE * mmap.PAGESIZE)
+        # Anonymous mmaps are page-aligned, which O_DIRECT requires of the source buffer.
+        self._buffer = mmap.mmap(-1, self._size)
+        self._view = memoryview(self._buffer)
+        self._used = 0
+        self._direct = True
+
+    def write(self, data):
+        data = memoryview(data)
+        total = len(data)
+        offset = 0
+        while offset < total:
+            n = min(self._size - self._used, total - offset)
+            self._view[self._used:self._used + n] = data[offset:offset + n]
+            self._used += n
+            offset += n
+            if self._used == self._size:
+                self._flush_buffer()
+        return total
+
+    def _flush_buffer(self):
+        if self._used % mmap.PAGESIZE:
+            self._disable_direct()
+        try:
+            self._write_all(self._view[:self._used])
+        except OSError as e:
+            if e.errno != errno.EINVAL or not self._direct:
+                raise
+            self._disable_direct()
+            self._write_all(self._view[:self._used])
+        self._used = 0
+
+    def _write_all(self, view):
+        with view:
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+
+    def _disable_direct(self):
+        if self._direct:
+            import fcntl
+            flags = fcntl.fcntl(self._fd, fcntl.F_GETFL)
+            fcntl.fcntl(self._fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+            self._direct = False
+
+    def close(self):
+        if self._fd is None:
+            return
+        try:
+            if self._used:
+                self._flush_buffer()
+        finally:
+            self._view.release()
+            self._buffer.close()
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _aligned_open(path, direct=False):
+    """Open path for writing, bypassing the page cache when direct is set and O_DIRECT is available."""
+    if direct and hasattr(os, 'O_DIRECT'):
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o644)
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+        else:
+            return _DirectWriter(fd, BOX_CHUNK_SIZE)
+    return open(path, 'wb', buffering=BOX_CHUNK_SIZE)
+
+@retry()
+def _download_to_path(file_item, file_path):
+    # Reopening on each attempt truncates whatever a failed attempt left behind. download_to has no
+    # chunk size knob, so a BOX_CHUNK_SIZE write buffer coalesces its small chunks into fewer write syscalls.
+    with _aligned_open(file_path, direct=BOX_DIRECT_IO) as f:
+        file_item.download_to(f)
+
+@retry()
+def _simple_upload(folder, file_path, file_name):
+    return folder.upload(file_path, file_name=file_name)
+
+def _chunked_upload(folder, file_path, file_name):
+    file_size = os.path.getsize(file_path)
+    # The session is created here rather than via get_chunked_uploader so its ID can be reported
+    # and the file handle closed.
+    upload_session = retry()(folder.create_upload_session)(file_size, file_name)
+    with open(file_path, 'rb') as content_stream:
+        uploader = upload_session.get_chunked_uploader_for_stream(content_stream, file_size)
+        started = False
+
+        # After the first failure, resume() re-sends only the parts the upload session is missing
+        # instead of opening a new session and starting over.
+        @retry()
+        def _send_parts():
+            nonlocal started
+            if started:
+                return uploader.resume()
+            started = True
+            return uploader.start()
+
+        try:
+            uploaded_file = _send_parts()
+        except Exception:
+            try:
+                uploader.abort()
+            except Exception as e:
+                log.warning(f"Could not abort Box upload session {upload_session.object_id} for '{file_name}': {e}")
+            raise
+
+    if uploaded_file is None:
+        # boxsdk has already retried the commit and Box is still processing it; the file may yet
+        # appear, so the session is left alone rather than aborted.
+        raise RuntimeError(
+            f"Box has not finished committing upload session {upload_session.object_id} for '{file_name}'. "
+            "Check the folder before retrying, as a new upload may conflict with it."
+        )
+    return uploaded_file
+
+def _upload_to_folder(folder, file_path, file_name):
+    # Box only accepts chunked upload sessions for files above 20 MB; past the threshold the
+    # parts are sent separately and a failed session can be resumed.
+    if os.path.getsize(file_path) > CHUNKED_UPLOAD_THRESHOLD:
+        return _chunked_upload(folder, file_path, file_name)
+    return _simple_upload(folder, file_path, file_name)
+
+def _list_folder_files(client, folder, file_prefix_filter, use_search=False, file_extensions=None):
+    """Yield the files directly inside folder, using Box search when a prefix narrows the listing.
+
+    The search index is eventually consistent: files uploaded in the last few minutes may be
+    missing from search results, so use_search trades freshness for fewer pages on large folders.
+    Search matches whole words, not prefixes, so the prefix must itself be a complete search token
+    ('cleaned', not 'clean'). The caller's startswith check only drops files where the word appears
+    elsewhere in the name; it cannot recover files search missed. When search returns nothing the
+    folder is listed with get_items() instead.
+    """
+    fields = ['name', 'type', 'id', 'size', 'sha1']
+    if use_search and file_prefix_filter:
+        results = client.search().query(
+            query=file_prefix_filter,
+            ancestor_folders=[folder],
+            file_extensions=file_extensions,
+            result_type='file',
+            content_types=['name'],
+            limit=200,
+            fields=fields + ['parent'],
+        )
+        # ancestor_folders also matches nested subfolders; keep to the folder's direct children.
+        matches = [
+            item for item in results
+            if item.parent is not None and item.parent.object_id == folder.object_id
+        ]
+        if matches:
+            yield from matches
+            return
+        log.info(f"Box search found no files for '{file_prefix_filter}'; listing the folder instead.")
+
+    yield from folder.get_items(limit=1000, fields=fields)
+
+def download_box_files(folder_id, target_dir, file_prefix_filter=None, verbose=False, access_token=None,
+                       use_search=False, file_extensions=None):
    
-    client = get_box_client()
+    client = get_box_client(access_token)
     if client is None:
         return []
 
     try:
         folder = client.folder(folder_id).get()
-        print(f"Accessing Box folder '{folder.name}' (ID: {folder_id})...")
+        log.info(f"Accessing Box folder '{folder.name}' (ID: {folder_id})...")
     except BoxAPIException as e:
-        print(f"ERROR: Box API access failed for folder ID {folder_id}: {e.status} - {e.message}")
+        log.error(f"Box API access failed for folder ID {folder_id}: {e.status} - {e.message}")
         if e.status == 404:
-            print("Please ensure the folder ID is correct and the Box application has access.")
+            log.error("Please ensure the folder ID is correct and the Box application has access.")
         elif e.status == 401:
-            print("Authentication error. Please check your Box OAuth2 credentials and application authorization.")
+            log.error("Authentication error. Please check your Box OAuth2 credentials and application authorization.")
         return []
     except Exception as e:
-        print(f"An unexpected error occurred while accessing Box folder ID {folder_id}: {e}")
+        log.error(f"An unexpected error occurred while accessing Box folder ID {folder_id}: {e}")
         return []
 
     os.makedirs(target_dir, exist_ok=True)
     downloaded_files = []
 
-    print(f"Checking files in Box folder '{folder.name}'...")
-    for file_item in folder.get_items():
-        if file_item.type == 'file':
-            if file_prefix_filter and not file_item.name.startswith(file_prefix_filter):
-                print(f"Skipping: {file_item.name} (does not start with '{file_prefix_filter}')")
-                continue
+    def _download_one(file_item, name, file_path) -> Optional[str]:
+        if _is_up_to_date(file_path, file_item.size, file_item.sha1):
+            log.debug(f"Up to date, skipping: {name}")
+            return name
+        log.debug(f"Downloading: {name}")
+        try:
+            _download_to_path(file_item, file_path)
+            return name
+        except Exception as e:
+            log.error(f"Failed to download {name}: {e}")
+            return None
 
-            print(f"Downloading: {file_item.name}")
-            try:
-                file_content = io.BytesIO()
-                file_item.download_to(file_content)
+    log.info(f"Checking files in Box folder '{folder.name}'...")
+    # Loop invariants are hoisted so a skipped item costs one attribute lookup and one startswith.
+    pref = file_prefix_filter or ""
+    has_pref = bool(pref)
+    join = os.path.join
+    target = target_dir
+    items = []
+    for file_item in _list_folder_files(client, folder, pref, use_search, file_extensions):
+        if file_item.type != 'file':
+            continue
+        name = file_item.name
+        if has_pref and not name.startswith(pref):
+            if verbose:
+                log.info(f"Skipping: {name} (does not start with '{pref}')")
+            continue
+        items.append((file_item, name))
+    # Largest files first, so small ones fill idle workers instead of one big file trailing at the end.
+    items.sort(key=lambda pair: pair[0].size or 0, reverse=True)
 
-                file_path = os.path.join(target_dir, file_item.name)
-                with open(file_path, 'wb') as f:
-                    f.write(file_content.getbuffer())
-                downloaded_files.append(file_item.name)
-            except Exception as e:
-                print(f"ERROR: Failed to download {file_item.name}: {e}")
-                continue
-    print(f"Downloaded files: {downloaded_files}")
+    with ThreadPoolExecutor(max_workers=BOX_DOWNLOAD_WORKERS) as executor:
+        submit = executor.submit
+        futures = [submit(_download_one, file_item, name, join(target, name)) for file_item, name in items]
+
+        # Results are collected on this thread only, so the list needs no lock.
+        for future in as_completed(futures):
+            file_name = future.result()
+            if file_name is not None:
+                downloaded_files.append(file_name)
+    log.info(f"Downloaded files: {downloaded_files}")
     return downloaded_files
 
-def upload_file_to_box(folder_id, file_path):
+def upload_file_to_box(folder_id, file_path, access_token=None):
    
-    client = get_box_client()
+    client = get_box_client(access_token)
     if client is None:
         return None
 
     if not os.path.exists(file_path):
-        print(f"ERROR: Local file not found for upload: {file_path}")
+        log.error(f"Local file not found for upload: {file_path}")
         return None
 
     file_name = os.path.basename(file_path)
     try:
-        folder = client.folder(folder_id).get() 
-        uploaded_file = folder.upload(file_path, file_name=file_name)
-        print(f"Uploaded file '{file_name}' to Box folder '{folder.name}' (ID: {folder_id}) with file ID: {uploaded_file.id}")
+        folder = client.folder(folder_id)
+        uploaded_file = _upload_to_folder(folder, file_path, file_name)
+        log.info(f"Uploaded file '{file_name}' to Box folder ID {folder_id} with file ID: {uploaded_file.id}")
         return uploaded_file
     except BoxAPIException as e:
-        print(f"ERROR: Box API upload failed for file '{file_name}' to folder ID {folder_id}: {e.status} - {e.message}")
+        log.error(f"Box API upload failed for file '{file_name}' to folder ID {folder_id}: {e.status} - {e.message}")
         if e.status == 404:
-            print("Please ensure the upload folder ID is correct and exists.")
+            log.error("Please ensure the upload folder ID is correct and exists.")
         elif e.status == 403:
-            print("Permission denied. Please check your Box application's permissions for write access.")
+            log.error("Permission denied. Please check your Box application's permissions for write access.")
         return None
     except Exception as e:
-        print(f"An unexpected error occurred during upload of '{file_name}': {e}")
+        log.error(f"An unexpected error occurred during upload of '{file_name}': {e}")
         return None
 
+def upload_files_to_box(folder_id, file_paths, max_workers=BOX_UPLOAD_WORKERS, access_token=None):
+
+    client = get_box_client(access_token)
+    if client is None:
+        return [], list(file_paths)
+
+    folder = client.folder(folder_id)
+    successes = []
+    failures = []
+
+    def _upload_one(file_path):
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Local file not found for upload: {file_path}")
+        return _upload_to_folder(folder, file_path, os.path.basename(file_path))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_upload_one, file_path): file_path for file_path in file_paths}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            file_name = os.path.basename(file_path)
+            try:
+                uploaded_file = future.result()
+                log.info(f"Uploaded file '{file_name}' to Box folder ID {folder_id} with file ID: {uploaded_file.id}")
+                successes.append(uploaded_file)
+            except BoxAPIException as e:
+                log.error(f"Box API upload failed for file '{file_name}' to folder ID {folder_id}: {e.status} - {e.message}")
+                failures.append(file_path)
+            except Exception as e:
+                log.error(f"Failed to upload '{file_name}': {e}")
+                failures.append(file_path)
+
+    log.info(f"Uploaded {len(successes)} of {len(file_paths)} files to Box folder ID {folder_id}.")
+    return successes, failures
+
+class _AsyncBoxAuth:
+    """Bearer token shared by the async tasks; refreshed at most once per expired token."""
+
+    def __init__(self, oauth, access_token, can_refresh=True):
+        self._oauth = oauth
+        self._lock = asyncio.Lock()
+        self._can_refresh = can_refresh
+        self.access_token = access_token
+
+    @property
+    def headers(self):
+        return {'Authorization': f"Bearer {self.access_token}"}
+
+    async def refresh(self, stale_token):
+        # A developer token has no refresh token; the retried request then fails with the 401.
+        if not self._can_refresh:
+            return
+        async with self._lock:
+            # Another task may already have replaced the token that just got a 401.
+            if self.access_token == stale_token:
+                self.access_token = (await asyncio.to_thread(self._oauth.refresh, stale_token))[0]
+
+async def _async_list_folder_files(http, auth, folder_id, file_prefix_filter=None):
+    files = []
+    offset = 0
+    while True:
+        for attempt in range(2):
+            token = auth.access_token
+            response = await http.get(
+                f"{BOX_API_URL}/folders/{folder_id}/items",
+                params={'fields': 'name,type,id,size,sha1', 'limit': 1000, 'offset': offset},
+                headers=auth.headers,
+            )
+            if response.status_code != 401 or attempt:
+                break
+            await auth.refresh(token)
+        response.raise_for_status()
+        page = response.json()
+        for entry in page['entries']:
+            if entry['type'] != 'file':
+                continue
+            if file_prefix_filter and not entry['name'].startswith(file_prefix_filter):
+                continue
+            files.append(entry)
+        offset += len(page['entries'])
+        if not page['entries'] or offset >= page['total_count']:
+            files.sort(key=lambda entry: entry.get('size') or 0, reverse=True)
+            return files
+
+async def _async_download_one(http, auth, semaphore, entry, target_dir) -> Optional[str]:
+    file_path = os.path.join(target_dir, entry['name'])
+    async with semaphore:
+        if await asyncio.to_thread(_is_up_to_date, file_path, entry.get('size'), entry.get('sha1')):
+            log.debug(f"Up to date, skipping: {entry['name']}")
+            return entry['name']
+        log.debug(f"Downloading: {entry['name']}")
+        try:
+            for attempt in range(2):
+                token = auth.access_token
+                async with http.stream('GET', f"{BOX_API_URL}/files/{entry['id']}/content", headers=auth.headers) as response:
+                    if response.status_code == 401 and not attempt:
+                        await auth.refresh(token)
+                        continue
+                    response.raise_for_status()
+                    async with aiofiles.open(file_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes(BOX_CHUNK_SIZE):
+                            await f.write(chunk)
+                return entry['name']
+        except Exception as e:
+            log.error(f"Failed to download {entry['name']}: {e}")
+            return None
+
+async def async_download_box_files(folder_id, target_dir, file_prefix_filter=None, access_token=None):
+    """Download a Box folder over a single httpx connection pool; suited to many small files."""
+    client = get_box_client(access_token)
+    if client is None:
+        return []
+
+    try:
+        oauth = client.auth
+        if access_token:
+            bearer_token = access_token
+        else:
+            # The cached client's token may be close to (or past) expiry, so start from a fresh one.
+            bearer_token = (await asyncio.to_thread(oauth.refresh, oauth.access_token))[0]
+        auth = _AsyncBoxAuth(oauth, bearer_token, can_refresh=not access_token)
+    except Exception as e:
+        log.error(f"Error obtaining a Box access token: {e}")
+        return []
+
+    os.makedirs(target_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(ASYNC_MAX_CONNECTIONS)
+    async with httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS),
+        follow_redirects=True,
+        timeout=httpx.Timeout(60.0),
+    ) as http:
+        try:
+            entries = await _async_list_folder_files(http, auth, folder_id, file_prefix_filter)
+        except (httpx.HTTPError, BoxOAuthException) as e:
+            log.error(f"Box API access failed for folder ID {folder_id}: {e}")
+            return []
+
+        results = await asyncio.gather(
+            *(_async_download_one(http, auth, semaphore, entry, target_dir) for entry in entries)
+        )
+
+    downloaded_files = [name for name in results if name is not None]
+    log.info(f"Downloaded files: {downloaded_files}")
+    return downloaded_files
+
 if __name__ == "__main__":
-   
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(message)s')
+    configure()
+
     os.makedirs(SOURCE_DATA_DIR, exist_ok=True)
 
-    print("\n--- Attempting to download cleaned CSV files from Box using OAuth2 Refresh Token ---")
+    log.info("--- Attempting to download cleaned CSV files from Box using OAuth2 Refresh Token ---")
     download_box_files(
         folder_id=BOX_DOWNLOAD_FOLDER_ID,
         target_dir=SOURCE_DATA_DIR,